@@ -0,0 +1,68 @@
+"""
+Import-time and startup benchmark.
+
+Measures, in fresh interpreters, how long it takes to import
+`prometheus_redis.metrics` and to create a registry with a few metrics,
+and reports which heavy modules got pulled in along the way.
+
+Usage: python benchmarks/import_time.py [--runs N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import prometheus_redis.metrics as metrics
+imported = time.perf_counter()
+from prometheus_redis.registry import RedisRegistry
+registry = RedisRegistry(url='redis://localhost:6379/0')
+metrics.Counter('bench_counter', 'Counter', registry=registry)
+metrics.CommonGauge('bench_gauge', 'Gauge', labelnames=['a'], registry=registry)
+metrics.Summary('bench_summary', 'Summary', registry=registry)
+ready = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'startup': ready - start,
+    'heavy_modules': sorted(
+        m for m in ('redis', 'redis.asyncio', 'apscheduler') if m in sys.modules
+    ),
+}))
+"""
+
+
+def run_once() -> dict:
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [SRC_DIR, env.get('PYTHONPATH')]))
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    for field in ('import', 'startup'):
+        samples = [r[field] * 1000 for r in results]
+        print(f'{field:>8}: median {statistics.median(samples):.2f} ms, '
+              f'min {min(samples):.2f} ms, max {max(samples):.2f} ms')
+    print(f'  loaded: {", ".join(results[-1]["heavy_modules"]) or "none"}')
+
+
+if __name__ == '__main__':
+    main()
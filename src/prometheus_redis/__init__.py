@@ -1,4 +1,4 @@
 from .registry import REGISTRY, RedisRegistry
-from metrics import CommonGauge, Counter, Summary
+from .metrics import CommonGauge, Counter, Summary
 
 __version__ = '0.1.0'
@@ -0,0 +1,186 @@
+"""
+Encoding of label sets into Redis keys.
+"""
+
+import base64
+import json
+
+INTERNED_PREFIX = '#'
+
+
+def dump_labels(labels: dict) -> str:
+    """
+    Serialise a label set into its canonical JSON form
+    """
+    return json.dumps(labels, sort_keys=True)
+
+
+class LabelCodec:
+    """
+    Encode label sets into the packed form used in metric keys.
+
+    By default label sets are packed as base64 of their sorted JSON, which
+    needs no extra state at the cost of long keys.
+
+    With `compact` enabled label sets are interned to small integer IDs
+    instead, written as `#1a` (the ID in base 36). The IDs are allocated
+    through a dictionary kept in Redis, so that every process agrees on
+    them, and cached locally in both directions. The dictionary is stored
+    in `<key>:ids` (hash of JSON label set to ID), `<key>:labels` (hash of
+    ID to JSON label set) and `<key>:next` (the ID counter).
+
+    Both forms are always decoded, so a registry can read either layout
+    while a migration is in progress.
+    """
+
+    def __init__(self,
+                 registry,
+                 compact: bool = False,
+                 key: str = 'prometheus_redis_labels',
+                 ):
+        self.registry = registry
+        self.compact = compact
+        self.key = key
+        self._ids: dict[str, str] = {}
+        self._labels: dict[str, dict] = {}
+
+    @property
+    def ids_key(self) -> str:
+        return f'{self.key}:ids'
+
+    @property
+    def labels_key(self) -> str:
+        return f'{self.key}:labels'
+
+    @property
+    def counter_key(self) -> str:
+        return f'{self.key}:next'
+
+    @staticmethod
+    def _format_id(number: int) -> str:
+        digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+        packed = ''
+        while True:
+            number, remainder = divmod(number, 36)
+            packed = digits[remainder] + packed
+            if not number:
+                break
+
+        return f'{INTERNED_PREFIX}{packed}'
+
+    def _remember(self, dumped: str, packed: str | bytes):
+        if isinstance(packed, bytes):
+            packed = packed.decode()
+        self._ids[dumped] = packed
+        self._labels[packed] = json.loads(dumped)
+
+    async def encode(self, labels: dict, compact: bool = None) -> str:
+        """
+        Get the packed form of a label set
+
+        :param labels: The label set
+        :param compact: Override the codec setting for this call.
+        """
+        return (await self.encode_many([labels], compact=compact))[0]
+
+    async def encode_many(self, label_sets: list[dict], compact: bool = None) -> list[str]:
+        """
+        Get the packed forms of many label sets
+
+        Label sets missing from the local cache are interned together, in a
+        fixed number of round trips however many there are.
+
+        :param label_sets: The label sets
+        :param compact: Override the codec setting for this call.
+        """
+        compact = self.compact if compact is None else compact
+        dumped_sets = [dump_labels(labels) for labels in label_sets]
+
+        if not compact:
+            return [
+                base64.b64encode(dumped.encode()).decode()
+                for dumped in dumped_sets
+            ]
+
+        missing = list(dict.fromkeys(
+            dumped for dumped in dumped_sets if dumped not in self._ids
+        ))
+        if missing:
+            await self._intern(missing)
+
+        return [self._ids[dumped] for dumped in dumped_sets]
+
+    async def _intern(self, missing: list[str]):
+        """
+        Look up or allocate the IDs of label sets, and cache them
+        """
+        db = self.registry.db
+        found = await db.hmget(self.ids_key, missing)
+        unknown = []
+        for dumped, packed in zip(missing, found):
+            if packed is None:
+                unknown.append(dumped)
+            else:
+                self._remember(dumped, packed)
+
+        if not unknown:
+            return
+
+        # Reserve a block of IDs, publish the reverse mappings before the IDs
+        # can be used anywhere, then claim the label sets. Losing a race to
+        # another process only costs an ID.
+        last_id = await db.incrby(self.counter_key, len(unknown))
+        candidates = [
+            self._format_id(number)
+            for number in range(last_id - len(unknown) + 1, last_id + 1)
+        ]
+
+        pipeline = db.pipeline()
+        for dumped, candidate in zip(unknown, candidates):
+            await pipeline.hset(self.labels_key, candidate, dumped)
+        for dumped, candidate in zip(unknown, candidates):
+            await pipeline.hsetnx(self.ids_key, dumped, candidate)
+        claimed = (await pipeline.execute())[len(unknown):]
+
+        lost = []
+        for dumped, candidate, won in zip(unknown, candidates, claimed):
+            if won:
+                self._remember(dumped, candidate)
+            else:
+                lost.append((dumped, candidate))
+
+        if not lost:
+            return
+
+        pipeline = db.pipeline()
+        await pipeline.hdel(self.labels_key, *[candidate for _, candidate in lost])
+        await pipeline.hmget(self.ids_key, [dumped for dumped, _ in lost])
+        winners = (await pipeline.execute())[1]
+        for (dumped, _), packed in zip(lost, winners):
+            self._remember(dumped, packed)
+
+    async def decode(self, packed: str) -> dict:
+        """
+        Get the label set back from its packed form
+        """
+        if not packed.startswith(INTERNED_PREFIX):
+            return json.loads(base64.b64decode(packed).decode())
+
+        if packed not in self._labels:
+            # Reload the whole dictionary, other processes most likely
+            # interned several new label sets since the last miss.
+            dictionary = await self.registry.db.hgetall(self.labels_key)
+            for label_id, dumped in dictionary.items():
+                self._remember(dumped.decode(), label_id.decode())
+
+        if packed not in self._labels:
+            raise ValueError(f'Unknown label set ID {packed}')
+
+        return dict(self._labels[packed])
+
+    def clear_cache(self):
+        """
+        Drop the locally cached dictionary
+        """
+        self._ids.clear()
+        self._labels.clear()
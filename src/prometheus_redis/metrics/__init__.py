@@ -5,4 +5,5 @@ Metrics implementation.
 from .base_metric import BaseMetric, MetricType
 from .common_gauge import CommonGauge
 from .counter import Counter
+from .gauge import Gauge, GaugeAggregation
 from .summary import Summary
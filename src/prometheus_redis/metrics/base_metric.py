@@ -2,8 +2,6 @@
 Base class for all metrics
 """
 
-import base64
-import json
 from enum import Enum
 from functools import partial
 
@@ -52,6 +50,10 @@ class BaseMetric:
     """
     metric_type: MetricType = None
     wrapped_functions_names = []
+    # Whether the registry may reuse the rendered output while the version
+    # counter is unchanged. Metrics whose series expire must not, as expiry
+    # does not bump the version.
+    cache_output = True
 
     def __init__(self,
                  name: str,
@@ -80,23 +82,47 @@ class BaseMetric:
         """
         return f'{self.name}_group'
 
-    def get_metric_key(self, labels, suffix: str = None):
+    @property
+    def metric_version_key(self):
+        """
+        Get the key of the version counter, bumped on every write
+        """
+        return f'{self.name}_version'
+
+    async def get_metric_key(self, labels, suffix: str = None, compact: bool = None):
         """
         Get a key for one label in redis
+
+        The labels are packed by the registry label codec. `compact`
+        overrides the codec setting.
         """
-        packed_labels = base64.b64encode(
-            json.dumps(labels, sort_keys=True).encode()
-        ).decode()
+        packed_labels = await self.registry.label_codec.encode(labels, compact=compact)
 
+        return self._format_metric_key(packed_labels, suffix)
+
+    def _format_metric_key(self, packed_labels: str, suffix: str = None) -> str:
+        """
+        Build a key from labels already packed by the registry label codec
+        """
         return f'{self.name}{suffix or ""}:{packed_labels}'
 
-    @staticmethod
-    def parse_metric_key(key: bytes) -> (str, dict):
+    async def get_metric_keys(self, label_sets: list[dict], suffix: str = None) -> list[str]:
+        """
+        Get the keys for many label sets in redis
+
+        Label sets new to the codec are interned together, see
+        `LabelCodec.encode_many`.
+        """
+        packed = await self.registry.label_codec.encode_many(label_sets)
+
+        return [self._format_metric_key(packed_labels, suffix) for packed_labels in packed]
+
+    async def parse_metric_key(self, key: bytes) -> (str, dict):
         """
         Get the metric name and labels from a redis key
         """
         name, packed_labels = key.decode().split(':', maxsplit=1)
-        labels = json.loads(base64.b64decode(packed_labels).decode())
+        labels = await self.registry.label_codec.decode(packed_labels)
 
         return name, labels
 
@@ -107,6 +133,63 @@ class BaseMetric:
                 f'Got only: {", ".join(labels.keys())}'
             )
 
+    def _group_by_labels(self, items) -> list[tuple[dict, list]]:
+        """
+        Validate `(labels, value)` pairs and group the values by label set.
+
+        The order of the values inside one group is preserved.
+        """
+        groups: dict[tuple, tuple[dict, list]] = {}
+        for labels, value in items:
+            labels = labels or {}
+            self._check_labels(labels)
+            group_id = tuple(sorted(labels.items()))
+            if group_id not in groups:
+                groups[group_id] = (labels, [])
+            groups[group_id][1].append(value)
+
+        return list(groups.values())
+
+    def _pipeline(self):
+        """
+        Get the pipeline to queue an update into
+
+        Inside `registry.batch()` this is the shared batch pipeline.
+        """
+        pipeline = self.registry.batch_pipeline
+        if pipeline is None:
+            pipeline = self.registry.db.pipeline()
+        return pipeline
+
+    async def _execute(self, pipeline, index: int = None):
+        """
+        Execute a pipeline obtained from `_pipeline`
+
+        The version counter of the metric is bumped in the same pipeline.
+        Batch pipelines are left to the registry, and `None` is returned.
+        If `index` is given, only that reply is returned.
+        """
+        await pipeline.incr(self.metric_version_key)
+        if pipeline is self.registry.batch_pipeline:
+            return None
+
+        result = (await pipeline.execute())[:-1]
+        if index is not None:
+            return result[index]
+        return result
+
+    def _after_execute(self, pipeline, callback, start: int = 0):
+        """
+        Run `callback` once a pipeline passed to `_execute` has been written
+
+        Right away for a standalone pipeline. For a batch pipeline, on flush
+        and only if the commands queued from position `start` succeeded.
+        """
+        if pipeline is self.registry.batch_pipeline:
+            self.registry.add_flush_callback(callback, start)
+        else:
+            callback()
+
     def labels(self, *args, **kwargs):
         """
         Add labels to the metric
@@ -123,6 +206,23 @@ class BaseMetric:
             wrapped_functions_names=self.wrapped_functions_names,
         )
 
+    @staticmethod
+    def format_sample(name: str, labels: dict | None, value) -> str:
+        """
+        Format one sample line of the Prometheus output
+        """
+        if labels is None:
+            labels_str = ''
+        else:
+            labels_str = ','.join([
+                f'{key}="{labels[key]}"'
+                for key in sorted(labels.keys())
+            ])
+            if labels_str:
+                labels_str = f'{{{labels_str}}}'
+
+        return f'{name}{labels_str} {value}'
+
     async def collect(self) -> list[str]:
         """
         Collect the metric values
@@ -135,26 +235,21 @@ class BaseMetric:
 
         result: list[str] = []
         for metric_key in members:
-            name, labels = self.parse_metric_key(metric_key)
+            name, labels = await self.parse_metric_key(metric_key)
             value = await db.get(metric_key)
             if value is None:
                 await db.srem(group_key, metric_key)
                 continue
 
-            value = value.decode()
+            result.append(self.format_sample(name, labels, value.decode()))
+        return result
 
-            if labels is None:
-                labels_str = ''
-            else:
-                labels_str = ','.join([
-                    f'{key}="{labels[key]}"'
-                    for key in sorted(labels.keys())
-                ])
-                if labels_str:
-                    labels_str = f'{{{labels_str}}}'
+    def reset_after_fork(self):
+        """
+        Drop per-process state inherited from the parent process
 
-            result.append(f'{name}{labels_str} {value}')
-        return result
+        Called by the registry in every forked child.
+        """
 
     async def cleanup(self):
         pass
@@ -13,6 +13,9 @@ class CommonGauge(BaseMetric):
     """
     metric_type = MetricType.GAUGE
     wrapped_functions_names = ['set', 'inc', 'dec']
+    # Any write, from any process, may set an expire, and expiry does not
+    # bump the version counter.
+    cache_output = False
 
     def __init__(self,
                  name: str,
@@ -46,12 +49,26 @@ class CommonGauge(BaseMetric):
                    expire: int = None,
                    ):
         group_key = self.metric_group_key
-        metric_key = self.get_metric_key(labels)
+        metric_key = await self.get_metric_key(labels)
 
-        pipeline = self.registry.db.pipeline()
+        pipeline = self._pipeline()
         await pipeline.sadd(group_key, metric_key)
         await pipeline.set(metric_key, value, ex=expire)
-        return await pipeline.execute()
+        return await self._execute(pipeline)
+
+    @log_exceptions
+    async def _set_many(self,
+                        groups: list[tuple[dict, list[float]]],
+                        expire: int = None,
+                        ):
+        group_key = self.metric_group_key
+        metric_keys = await self.get_metric_keys([labels for labels, _ in groups])
+
+        pipeline = self._pipeline()
+        await pipeline.sadd(group_key, *metric_keys)
+        for metric_key, (_, values) in zip(metric_keys, groups):
+            await pipeline.set(metric_key, values[-1], ex=expire)
+        return await self._execute(pipeline)
 
     @log_exceptions
     async def _inc(self,
@@ -60,13 +77,29 @@ class CommonGauge(BaseMetric):
                    expire: int = None,
                    ):
         group_key = self.metric_group_key
-        metric_key = self.get_metric_key(labels)
-        pipeline = self.registry.db.pipeline()
+        metric_key = await self.get_metric_key(labels)
+        pipeline = self._pipeline()
         await pipeline.sadd(group_key, metric_key)
         await pipeline.incrbyfloat(metric_key, float(value))
         if expire:
             await pipeline.expire(metric_key, expire)
-        return (await pipeline.execute())[1]
+        return await self._execute(pipeline, 1)
+
+    @log_exceptions
+    async def _inc_many(self,
+                        groups: list[tuple[dict, list[float]]],
+                        expire: int = None,
+                        ):
+        group_key = self.metric_group_key
+        metric_keys = await self.get_metric_keys([labels for labels, _ in groups])
+
+        pipeline = self._pipeline()
+        await pipeline.sadd(group_key, *metric_keys)
+        for metric_key, (_, values) in zip(metric_keys, groups):
+            await pipeline.incrbyfloat(metric_key, float(sum(values)))
+            if expire:
+                await pipeline.expire(metric_key, expire)
+        return await self._execute(pipeline)
 
     async def set(self,
             value: float,
@@ -97,3 +130,39 @@ class CommonGauge(BaseMetric):
         labels = labels or {}
         self._check_labels(labels)
         return await self._inc(-value, labels, expire=expire or self._expire)
+
+    async def set_many(self,
+                       items,
+                       expire: int = None,
+                       ):
+        """
+        Set many series at once.
+
+        `items` is an iterable of `(labels, value)` pairs. For identical label
+        sets the last value wins, and all series are written in one pipeline.
+        """
+        items = list(items)
+        if any(value is None for _, value in items):
+            raise ValueError('value can not be None')
+
+        groups = self._group_by_labels(items)
+        if not groups:
+            return None
+
+        return await self._set_many(groups, expire=expire or self._expire)
+
+    async def inc_many(self,
+                       items,
+                       expire: int = None,
+                       ):
+        """
+        Increase many series at once.
+
+        `items` is an iterable of `(labels, value)` pairs. Values of identical
+        label sets are summed locally, and all series are written in one pipeline.
+        """
+        groups = self._group_by_labels(items)
+        if not groups:
+            return None
+
+        return await self._inc_many(groups, expire=expire or self._expire)
@@ -7,21 +7,39 @@ from .base_metric import BaseMetric, MetricType
 
 
 class Counter(BaseMetric):
-    type = MetricType.COUNTER
+    metric_type = MetricType.COUNTER
     wrapped_functions_names = ['inc', 'set']
 
+    @staticmethod
+    def _check_value(value):
+        if not isinstance(value, int):
+            raise ValueError(f'Value should be int, got {type(value)}')
+
     @log_exceptions
     async def _inc(self,
                    value: int,
                    labels: dict[str, str],
                    ):
         group_key = self.metric_group_key
-        metric_key = self.get_metric_key(labels)
+        metric_key = await self.get_metric_key(labels)
 
-        pipeline = self.registry.db.pipeline()
+        pipeline = self._pipeline()
         await pipeline.sadd(group_key, metric_key)
         await pipeline.incrby(metric_key, int(value))
-        return (await pipeline.execute())[1]
+        return await self._execute(pipeline, 1)
+
+    @log_exceptions
+    async def _inc_many(self,
+                        groups: list[tuple[dict, list[int]]],
+                        ):
+        group_key = self.metric_group_key
+        metric_keys = await self.get_metric_keys([labels for labels, _ in groups])
+
+        pipeline = self._pipeline()
+        await pipeline.sadd(group_key, *metric_keys)
+        for metric_key, (_, values) in zip(metric_keys, groups):
+            await pipeline.incrby(metric_key, sum(values))
+        return await self._execute(pipeline)
 
     @log_exceptions
     async def _set(self,
@@ -29,12 +47,12 @@ class Counter(BaseMetric):
                    labels: dict[str, str],
                    ):
         group_key = self.metric_group_key
-        metric_key = self.get_metric_key(labels)
+        metric_key = await self.get_metric_key(labels)
 
-        pipeline = self.registry.db.pipeline()
+        pipeline = self._pipeline()
         await pipeline.sadd(group_key, metric_key)
         await pipeline.set(metric_key, int(value))
-        return (await pipeline.execute())[1]
+        return await self._execute(pipeline, 1)
 
     async def inc(self,
                   value: int = 1,
@@ -46,12 +64,27 @@ class Counter(BaseMetric):
         """
         labels = labels or {}
         self._check_labels(labels)
-
-        if not isinstance(value, int):
-            raise ValueError(f'Value should be int, got {type(value)}')
+        self._check_value(value)
 
         return await self._inc(value, labels)
 
+    async def inc_many(self, items):
+        """
+        Increase many series at once.
+
+        `items` is an iterable of `(labels, value)` pairs. Values of identical
+        label sets are summed locally, and all series are written in one pipeline.
+        """
+        items = list(items)
+        for _, value in items:
+            self._check_value(value)
+
+        groups = self._group_by_labels(items)
+        if not groups:
+            return None
+
+        return await self._inc_many(groups)
+
     async def set(self,
                   value: int = 1,
                   labels: dict[str, str] = None,
@@ -62,8 +95,6 @@ class Counter(BaseMetric):
         """
         labels = labels or {}
         self._check_labels(labels)
-
-        if not isinstance(value, int):
-            raise ValueError(f'Value should be int, got {type(value)}')
+        self._check_value(value)
 
         return await self._set(value, labels)
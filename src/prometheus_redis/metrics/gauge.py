@@ -1,21 +1,56 @@
 import asyncio
 import collections
+import time
+from enum import Enum
+from functools import partial
 
+from prometheus_redis.labels import INTERNED_PREFIX
 from prometheus_redis.util import log_exceptions
 from .base_metric import BaseMetric, MetricType
 
 
+class GaugeAggregation(Enum):
+    """
+    How the per-process values of a Gauge are combined at collect time
+    """
+    SUM = 'sum'
+    MAX = 'max'
+    MIN = 'min'
+    AVG = 'avg'
+    LATEST = 'latest'
+
+
 class Gauge(BaseMetric):
-    type = MetricType.GAUGE
+    metric_type = MetricType.GAUGE
     wrapped_functions_names = ['inc', 'set']
 
+    cache_output = False
+
     default_expire = 60
 
     def __init__(self, *args,
                  expire=default_expire,
                  refresh_enable=True,
                  gauge_index_key: str = 'GLOBAL_GAUGE_INDEX',
+                 aggregation: GaugeAggregation | str = None,
                  **kwargs):
+        """
+        Construct a per-process Gauge metric.
+
+        Every process writes its own series, labelled with a `gauge_index`
+        unique to the process, which expires unless the process keeps
+        refreshing it.
+
+        :param expire: Seconds after which the series of a dead process disappears.
+        :param refresh_enable: Periodically rewrite the series of this process.
+        :param gauge_index_key: Redis key of the counter allocating process indices.
+        :param aggregation: If set, the series of all live processes are combined
+        per label set at collect time (sum, max, min, avg or latest), and only
+        the combined series is exposed, without the `gauge_index` label.
+        """
+        if aggregation is not None:
+            aggregation = GaugeAggregation(aggregation)
+
         super().__init__(*args, **kwargs)
 
         self.gauge_index_key = gauge_index_key
@@ -25,6 +60,54 @@ class Gauge(BaseMetric):
         self.gauge_values = collections.defaultdict(lambda: 0.0)
         self.expire = expire
         self.index = None
+        self.aggregation = aggregation
+
+    @property
+    def metric_updated_key(self):
+        """
+        Get the key of the hash holding the last update time of each series
+
+        Only maintained for the `latest` aggregation.
+        """
+        return f'{self.name}_updated'
+
+    @property
+    def _track_updates(self) -> bool:
+        return self.aggregation is GaugeAggregation.LATEST
+
+    async def get_metric_key(self, labels, suffix: str = None, compact: bool = None):
+        """
+        Get a key for one label in redis
+
+        With compact labels, only the user labels are interned and the
+        `gauge_index` is appended to the ID (`#1a.17`). Indices are never
+        reused, so interning them would grow the label dictionary with
+        every process started.
+        """
+        codec = self.registry.label_codec
+        compact = codec.compact if compact is None else compact
+        if not compact or 'gauge_index' not in labels:
+            return await super().get_metric_key(labels, suffix, compact=compact)
+
+        labels = dict(labels)
+        index = labels.pop('gauge_index')
+        metric_key = await super().get_metric_key(labels, suffix, compact=True)
+
+        return f'{metric_key}.{index}'
+
+    async def parse_metric_key(self, key: bytes) -> (str, dict):
+        """
+        Get the metric name and labels from a redis key
+        """
+        name, packed_labels = key.decode().split(':', maxsplit=1)
+        if not packed_labels.startswith(INTERNED_PREFIX) or '.' not in packed_labels:
+            return await super().parse_metric_key(key)
+
+        packed_labels, index = packed_labels.split('.', maxsplit=1)
+        labels = await self.registry.label_codec.decode(packed_labels)
+        labels['gauge_index'] = int(index)
+
+        return name, labels
 
     async def refresh_values(self):
         async with self.lock:
@@ -50,15 +133,22 @@ class Gauge(BaseMetric):
     async def _inc(self, value: float, labels: dict):
         async with self.lock:
             group_key = self.metric_group_key
-            labels['gauge_index'] = self.get_gauge_index()
-            metric_key = self.get_metric_key(labels)
+            labels = {**labels, 'gauge_index': await self.get_gauge_index()}
+            metric_key = await self.get_metric_key(labels)
 
-            pipeline = self.registry.db.pipeline()
+            pipeline = self._pipeline()
+            start = len(pipeline)
             await pipeline.sadd(group_key, metric_key)
             await pipeline.incrbyfloat(metric_key, float(value))
             await pipeline.expire(metric_key, self.expire)
-            self._inc_internal(metric_key, float(value))
-            result = await pipeline.execute()
+            if self._track_updates:
+                await pipeline.hset(self.metric_updated_key, metric_key, time.time())
+            result = await self._execute(pipeline)
+            self._after_execute(
+                pipeline,
+                partial(self._inc_internal, metric_key, float(value)),
+                start,
+            )
 
         self.add_refresher()
 
@@ -68,18 +158,25 @@ class Gauge(BaseMetric):
     async def _set(self, value: float, labels: dict):
         async with self.lock:
             group_key = self.metric_group_key
-            labels['gauge_index'] = self.get_gauge_index()
-            metric_key = self.get_metric_key(labels)
+            labels = {**labels, 'gauge_index': await self.get_gauge_index()}
+            metric_key = await self.get_metric_key(labels)
 
-            pipeline = self.registry.db.pipeline()
+            pipeline = self._pipeline()
+            start = len(pipeline)
             await pipeline.sadd(group_key, metric_key)
             await pipeline.set(
                 metric_key,
                 float(value),
                 ex=self.expire,
             )
-            self._set_internal(metric_key, float(value))
-            result = await pipeline.execute()
+            if self._track_updates:
+                await pipeline.hset(self.metric_updated_key, metric_key, time.time())
+            result = await self._execute(pipeline)
+            self._after_execute(
+                pipeline,
+                partial(self._set_internal, metric_key, float(value)),
+                start,
+            )
 
         self.add_refresher()
 
@@ -117,6 +214,18 @@ class Gauge(BaseMetric):
             self.index = await self.make_gauge_index()
         return self.index
 
+    def reset_after_fork(self):
+        """
+        Give the child process its own gauge index and series.
+
+        The values of the parent belong to its `gauge_index` and are left to
+        the parent to refresh.
+        """
+        self.lock = asyncio.Lock()
+        self.gauge_values = collections.defaultdict(lambda: 0.0)
+        self.index = None
+        self._refresher_added = False
+
     async def cleanup(self):
         async with self.lock:
             group_key = self.metric_group_key
@@ -129,4 +238,77 @@ class Gauge(BaseMetric):
 
             await pipeline.srem(group_key, *keys)
             await pipeline.delete(*keys)
+            if self._track_updates:
+                await pipeline.hdel(self.metric_updated_key, *keys)
             await pipeline.execute()
+
+    @staticmethod
+    def _aggregate(aggregation: GaugeAggregation, samples: list[tuple[float, float]]) -> float:
+        """
+        Combine `(value, updated_at)` samples of one label set
+        """
+        values = [value for value, _ in samples]
+
+        if aggregation is GaugeAggregation.SUM:
+            return sum(values)
+        if aggregation is GaugeAggregation.MAX:
+            return max(values)
+        if aggregation is GaugeAggregation.MIN:
+            return min(values)
+        if aggregation is GaugeAggregation.AVG:
+            return sum(values) / len(values)
+
+        return max(samples, key=lambda sample: sample[1])[0]
+
+    async def collect(self) -> list[str]:
+        """
+        Collect the metric values
+
+        With an aggregation set, the series of all live processes are
+        combined per label set, and `gauge_index` is dropped from the output.
+        """
+        if self.aggregation is None:
+            return await super().collect()
+
+        db = self.registry.db
+        group_key = self.metric_group_key
+        members = list(await db.smembers(group_key))
+        if not members:
+            return []
+
+        # One GET per member rather than MGET, which fails with CROSSSLOT
+        # on a cluster. It is still a single round trip.
+        pipeline = db.pipeline()
+        for metric_key in members:
+            await pipeline.get(metric_key)
+        if self._track_updates:
+            await pipeline.hmget(self.metric_updated_key, members)
+        replies = await pipeline.execute()
+        values = replies[:len(members)]
+        updated = replies[len(members)] if self._track_updates else [None] * len(members)
+
+        groups: dict[tuple, tuple[dict, list]] = {}
+        expired = []
+        for metric_key, value, updated_at in zip(members, values, updated):
+            if value is None:
+                expired.append(metric_key)
+                continue
+
+            _, labels = await self.parse_metric_key(metric_key)
+            labels.pop('gauge_index', None)
+            group_id = tuple(sorted(labels.items()))
+            if group_id not in groups:
+                groups[group_id] = (labels, [])
+            groups[group_id][1].append((float(value), float(updated_at or 0)))
+
+        if expired:
+            pipeline = db.pipeline()
+            await pipeline.srem(group_key, *expired)
+            if self._track_updates:
+                await pipeline.hdel(self.metric_updated_key, *expired)
+            await pipeline.execute()
+
+        return [
+            self.format_sample(self.name, labels, self._aggregate(self.aggregation, samples))
+            for labels, samples in groups.values()
+        ]
@@ -10,7 +10,7 @@ from .base_metric import BaseMetric, MetricType
 
 
 class Histogram(BaseMetric):
-    type = MetricType.HISTOGRAM
+    metric_type = MetricType.HISTOGRAM
     wrapped_functions_names = ['observe']
 
     def __init__(self,
@@ -23,31 +23,65 @@ class Histogram(BaseMetric):
         self.buckets = sorted(buckets, reverse=True)
         self.timeit = partial(timer, metric_callback=self.observe)
 
-    @log_exceptions
-    async def _observe(self,
-                       value: float,
-                       labels: dict[str, str],
-                       ):
+    async def _queue_observations(self,
+                                  pipeline,
+                                  groups: list[tuple[dict, list[float]]],
+                                  ):
+        """
+        Queue the updates for observed values, grouped by label set, into a pipeline.
+
+        All label sets are packed in one go, and only for the buckets that
+        actually get incremented.
+        """
         group_key = self.metric_group_key
-        sum_key = self.get_metric_key(labels, '_sum')
-        counter_key = self.get_metric_key(labels, '_count')
 
-        pipeleine = self.registry.db.pipeline()
+        label_sets = []
+        bucket_counts = []
+        for labels, values in groups:
+            counts = []
+            for bucket in self.buckets:
+                bucket_count = sum(1 for value in values if value <= bucket)
+                if not bucket_count:
+                    break
+                counts.append(bucket_count)
+
+            bucket_counts.append(counts)
+            label_sets.append(labels)
+            label_sets += [{**labels, 'le': bucket} for bucket in self.buckets[:len(counts)]]
 
-        for bucket in self.buckets:
-            if value > bucket:
-                break
-            labels['le'] = bucket
-            bucket_key = self.get_metric_key(labels, '_bucket')
+        packed = iter(await self.registry.label_codec.encode_many(label_sets))
 
-            await pipeleine.sadd(group_key, bucket_key)
-            await pipeleine.incr(bucket_key)
+        for (_, values), counts in zip(groups, bucket_counts):
+            packed_labels = next(packed)
+            sum_key = self._format_metric_key(packed_labels, '_sum')
+            counter_key = self._format_metric_key(packed_labels, '_count')
 
-        await pipeleine.sadd(group_key, sum_key, counter_key)
-        await pipeleine.incr(counter_key)
-        await pipeleine.incrbyfloat(sum_key, float(value))
+            for bucket_count in counts:
+                bucket_key = self._format_metric_key(next(packed), '_bucket')
 
-        return await pipeleine.execute()
+                await pipeline.sadd(group_key, bucket_key)
+                await pipeline.incrby(bucket_key, bucket_count)
+
+            await pipeline.sadd(group_key, sum_key, counter_key)
+            await pipeline.incrby(counter_key, len(values))
+            await pipeline.incrbyfloat(sum_key, float(sum(values)))
+
+    @log_exceptions
+    async def _observe(self,
+                       value: float,
+                       labels: dict[str, str],
+                       ):
+        pipeline = self._pipeline()
+        await self._queue_observations(pipeline, [(labels, [value])])
+        return await self._execute(pipeline)
+
+    @log_exceptions
+    async def _observe_many(self,
+                            groups: list[tuple[dict, list[float]]],
+                            ):
+        pipeline = self._pipeline()
+        await self._queue_observations(pipeline, groups)
+        return await self._execute(pipeline)
 
     async def _get_missing_metric_values(self):
         db = self.registry.db
@@ -63,7 +97,7 @@ class Histogram(BaseMetric):
         sc_flag = True
 
         for metric_key in members:
-            _, labels = self.parse_metric_key(metric_key)
+            _, labels = await self.parse_metric_key(metric_key)
             key = json.dumps(labels, sort_keys=True)
 
             if 'le' in labels:
@@ -113,6 +147,20 @@ class Histogram(BaseMetric):
         self._check_labels(labels)
         return await self._observe(value, labels)
 
+    async def observe_many(self, items):
+        """
+        Observe many values at once.
+
+        `items` is an iterable of `(labels, value)` pairs. Bucket counts, sums
+        and counts of identical label sets are aggregated locally, and all
+        series are written in one pipeline.
+        """
+        groups = self._group_by_labels(items)
+        if not groups:
+            return None
+
+        return await self._observe_many(groups)
+
     async def collect(self) -> list[str]:
         """
         This is the main method used to generate the Prometheus output
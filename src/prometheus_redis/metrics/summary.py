@@ -5,27 +5,46 @@ from .base_metric import BaseMetric, MetricType
 
 
 class Summary(BaseMetric):
-    type = MetricType.SUMMARY
+    metric_type = MetricType.SUMMARY
     wrapped_functions_names = ['observe']
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.timeit = partial(timer, metric_callback=self.observe)
 
+    async def _queue_observations(self,
+                                  pipeline,
+                                  groups: list[tuple[dict, list]],
+                                  ):
+        group_key = self.metric_group_key
+        packed = await self.registry.label_codec.encode_many(
+            [labels for labels, _ in groups]
+        )
+
+        for packed_labels, (_, values) in zip(packed, groups):
+            sum_metric_key = self._format_metric_key(packed_labels, "_sum")
+            count_metric_key = self._format_metric_key(packed_labels, "_count")
+
+            await pipeline.sadd(group_key, count_metric_key, sum_metric_key)
+            await pipeline.incrbyfloat(sum_metric_key, float(sum(values)))
+            await pipeline.incrby(count_metric_key, len(values))
+
     @log_exceptions
     async def _observer(self,
                         value,
                         labels: dict[str, str],
                         ):
-        group_key = self.metric_group_key
-        sum_metric_key = self.get_metric_key(labels, "_sum")
-        count_metric_key = self.get_metric_key(labels, "_count")
+        pipeline = self._pipeline()
+        await self._queue_observations(pipeline, [(labels, [value])])
+        return await self._execute(pipeline, 1)
 
-        pipeline = self.registry.db.pipeline()
-        await pipeline.sadd(group_key, count_metric_key, sum_metric_key)
-        await pipeline.incrbyfloat(sum_metric_key, float(value))
-        await pipeline.incr(count_metric_key)
-        return (await pipeline.execute())[1]
+    @log_exceptions
+    async def _observe_many(self,
+                            groups: list[tuple[dict, list]],
+                            ):
+        pipeline = self._pipeline()
+        await self._queue_observations(pipeline, groups)
+        return await self._execute(pipeline)
 
     async def observe(self,
                       value,
@@ -35,3 +54,17 @@ class Summary(BaseMetric):
         self._check_labels(labels)
 
         return await self._observer(value, labels)
+
+    async def observe_many(self, items):
+        """
+        Observe many values at once.
+
+        `items` is an iterable of `(labels, value)` pairs. Sums and counts of
+        identical label sets are aggregated locally, and all series are
+        written in one pipeline.
+        """
+        groups = self._group_by_labels(items)
+        if not groups:
+            return None
+
+        return await self._observe_many(groups)
@@ -0,0 +1,90 @@
+"""
+Migration of stored metrics between label encodings.
+"""
+
+import logging
+
+from .metrics import MetricType
+from .registry import RedisRegistry, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+def _is_integer_series(metric, suffix: str) -> bool:
+    """
+    Whether a series is only ever written with integer increments
+    """
+    if metric.metric_type is MetricType.COUNTER:
+        return suffix == ''
+    if metric.metric_type in (MetricType.HISTOGRAM, MetricType.SUMMARY):
+        return suffix in ('_count', '_bucket')
+    return False
+
+
+async def migrate_label_encoding(registry: RedisRegistry = REGISTRY,
+                                 compact: bool = True,
+                                 ) -> int:
+    """
+    Rewrite the stored series of every metric in a registry to a label encoding.
+
+    Keys already in the target encoding are left alone, so the migration can
+    be run again safely. If a key in the target encoding already exists,
+    because some writers were switched before the migration, counter,
+    histogram and summary values are added to it, while gauges keep it as is.
+
+    Writers still using the old encoding should be stopped first, otherwise
+    updates made while the migration runs can be lost.
+
+    :param registry: The registry holding the metrics to migrate.
+    :param compact: Migrate to interned label IDs if set, to base64 labels otherwise.
+    :return: The number of migrated keys.
+    """
+    db = registry.db
+    migrated = 0
+
+    for metric in registry.metrics:
+        group_key = metric.metric_group_key
+        # Update times kept per series by Gauge(aggregation='latest')
+        updated_key = getattr(metric, 'metric_updated_key', None)
+
+        for old_key in await db.smembers(group_key):
+            name, labels = await metric.parse_metric_key(old_key)
+            suffix = name[len(metric.name):]
+            new_key = await metric.get_metric_key(labels, suffix, compact=compact)
+            if new_key == old_key.decode():
+                continue
+
+            value = await db.get(old_key)
+            pipeline = db.pipeline()
+            if value is None:
+                await pipeline.srem(group_key, old_key)
+                if updated_key is not None:
+                    await pipeline.hdel(updated_key, old_key)
+                await pipeline.execute()
+                continue
+
+            if metric.metric_type is MetricType.GAUGE:
+                ttl = await db.pttl(old_key)
+                await pipeline.set(new_key, value, nx=True, px=ttl if ttl > 0 else None)
+            elif _is_integer_series(metric, suffix):
+                await pipeline.incrby(new_key, int(value))
+            else:
+                # The target may already hold a float written by INCRBYFLOAT,
+                # which INCRBY would reject after the old key is gone.
+                await pipeline.incrbyfloat(new_key, float(value))
+
+            await pipeline.sadd(group_key, new_key)
+            await pipeline.srem(group_key, old_key)
+            await pipeline.delete(old_key)
+            if updated_key is not None:
+                updated_at = await db.hget(updated_key, old_key)
+                if updated_at is not None:
+                    await pipeline.hsetnx(updated_key, new_key, updated_at)
+                await pipeline.hdel(updated_key, old_key)
+            await pipeline.incr(metric.metric_version_key)
+            await pipeline.execute()
+            migrated += 1
+
+        logger.info('Migrated label encoding of metric %s', metric.name)
+
+    return migrated
@@ -1,50 +1,121 @@
+from __future__ import annotations
+
+import os
 import time
 import asyncio
 import inspect
-import redis.asyncio as redis
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.interval import IntervalTrigger
+import logging
+import weakref
+import contextvars
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
+
+from .labels import LabelCodec
+
+if TYPE_CHECKING:
+    import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
 
 
 class AsyncRefresher:
-    def __init__(self, refresh_period=30.0, timeout_granule=1):
+    def __init__(self,
+                 refresh_period=30.0,
+                 timeout_granule=1,
+                 use_apscheduler: bool = False,
+                 ):
         """
-        Fully async, non-blocking refresher using APScheduler.
+        Fully async, non-blocking refresher.
+
+        By default, the refresh cycle runs as a plain asyncio task. APScheduler
+        is only imported when `use_apscheduler` is set, so it stays an optional
+        dependency (`pip install prometheus-redis[apscheduler]`).
 
         :param refresh_period: Time interval (seconds) for executing refresh functions.
         :param timeout_granule: Minimum interval (seconds) between checks.
+        :param use_apscheduler: Drive the refresh cycle with APScheduler's AsyncIOScheduler.
         """
         self.refresh_period = refresh_period
         self.timeout_granule = timeout_granule
+        self.use_apscheduler = use_apscheduler
         self._refresh_functions = []
-        self._lock = asyncio.Lock()  # Ensures only one execution at a time
-        self._scheduler = AsyncIOScheduler()
+        self._lock = None  # Ensures only one execution at a time, created on first refresh
+        self._scheduler = None
+        self._task: asyncio.Task | None = None
         self._last_refresh_time = 0  # Tracks last execution time
 
+    @property
+    def running(self) -> bool:
+        """
+        Whether the refresh cycle is currently scheduled.
+        """
+        return self._scheduler is not None or self._task is not None
+
     def start(self):
         """
-        Starts the refresher using APScheduler.
+        Starts the refresher. Must be called with a running event loop.
+
+        Calling it on an already running refresher does nothing.
         """
-        self._scheduler.start()
-        self._scheduler.add_job(
-            self.refresh,
-            trigger=IntervalTrigger(seconds=self.timeout_granule),
-            id='refresh_cycle',
-            replace_existing=True
-        )
+        if self.running:
+            return
+
+        if self.use_apscheduler:
+            from apscheduler.schedulers.asyncio import AsyncIOScheduler
+            from apscheduler.triggers.interval import IntervalTrigger
+
+            self._scheduler = AsyncIOScheduler()
+            self._scheduler.start()
+            self._scheduler.add_job(
+                self.refresh,
+                trigger=IntervalTrigger(seconds=self.timeout_granule),
+                id='refresh_cycle',
+                replace_existing=True
+            )
+        else:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            self._task.add_done_callback(self._on_task_done)
+
+    def _on_task_done(self, task: asyncio.Task):
+        """
+        Forget the refresh task once it exits, so `start()` can run it again.
+        """
+        if self._task is task:
+            self._task = None
 
     def stop(self):
         """
         Stops the refresher and clears all registered functions.
         """
-        self._scheduler.remove_job('refresh_cycle')
-        self._scheduler.shutdown()
+        if self._scheduler is not None:
+            self._scheduler.remove_job('refresh_cycle')
+            self._scheduler.shutdown()
+            self._scheduler = None
+
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
         self._refresh_functions.clear()
 
+    async def _run(self):
+        """
+        Asyncio-native refresh cycle, checking every `timeout_granule` seconds.
+        """
+        while True:
+            await asyncio.sleep(self.timeout_granule)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception('Error while running refresh functions')
+
     async def refresh(self):
         """
         Executes all registered refresh functions while ensuring the interval condition is met.
         """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
         async with self._lock:
             now = time.time()
             if now - self._last_refresh_time < self.refresh_period:
@@ -65,26 +136,216 @@ class AsyncRefresher:
         """
         Registers a function to be periodically executed.
 
+        Registering the same function again does nothing.
+
         :param func: An async function to call when refreshed.
         """
-        self._refresh_functions.append(func)
+        if func not in self._refresh_functions:
+            self._refresh_functions.append(func)
 
 
 class RedisRegistry:
     def __init__(self,
                  db: redis.Redis | redis.RedisCluster = None,
+                 url: str = None,
+                 use_apscheduler: bool = False,
+                 compact_labels: bool = False,
+                 label_dict_key: str = 'prometheus_redis_labels',
+                 child_max_connections: int = None,
                  ):
+        """
+        Registry holding the metrics and the Redis connection they write to.
+
+        Nothing expensive happens here: the Redis client (when built from `url`)
+        and the refresher are only created on first use.
+
+        :param db: An existing `redis.asyncio` client.
+        :param url: Redis URL used to build a client lazily when `db` is not given.
+        :param use_apscheduler: Run the refresher with APScheduler instead of asyncio.
+        :param compact_labels: Intern label sets to small IDs in metric keys,
+        see `prometheus_redis.labels.LabelCodec`.
+        :param label_dict_key: Prefix of the Redis keys holding the label dictionary.
+        :param child_max_connections: Size of the connection pool of each process
+        forked from the one that created the registry (pre-fork servers such as
+        gunicorn). Unlimited if not set. Clients built from `url` then use a
+        `BlockingConnectionPool`, so writes wait for a free connection. For a
+        client passed as `db` the limit is only applied if its pool is a
+        `BlockingConnectionPool`; other pools are left unlimited with a warning.
+        """
         self._metrics = []
-        self._refresher = AsyncRefresher()
-        self.db = db
+        self._refresher: AsyncRefresher | None = None
+        self._db = db
+        self._owns_db = False
+        self._forked = False
+        self.url = url
+        self.child_max_connections = child_max_connections
+        self.use_apscheduler = use_apscheduler
+        self._label_codec: LabelCodec | None = None
+        self.compact_labels = compact_labels
+        self.label_dict_key = label_dict_key
+        self._rendered: dict[str, tuple[bytes, list[str]]] = {}
+        self._batch = contextvars.ContextVar(
+            f'batch_{id(self)}', default=None,
+        )
+        _registries.add(self)
+
+    @property
+    def db(self) -> redis.Redis | redis.RedisCluster:
+        """
+        The Redis client, created from `url` on first access if not set.
+        """
+        if self._db is None and self.url is not None:
+            import redis.asyncio as redis
+
+            if self._forked and self.child_max_connections:
+                # Wait for a free connection rather than failing writes
+                # once the limit is reached.
+                pool = redis.BlockingConnectionPool.from_url(
+                    self.url, max_connections=self.child_max_connections,
+                )
+                self._db = redis.Redis(connection_pool=pool)
+            else:
+                self._db = redis.from_url(self.url)
+            self._owns_db = True
+        return self._db
+
+    @db.setter
+    def db(self, value: redis.Redis | redis.RedisCluster):
+        self._db = value
+        self._owns_db = False
+
+    @property
+    def refresher(self) -> AsyncRefresher:
+        """
+        The refresher, created on first access.
+        """
+        if self._refresher is None:
+            self._refresher = AsyncRefresher(
+                use_apscheduler=self.use_apscheduler,
+            )
+        return self._refresher
+
+    @property
+    def metrics(self) -> list:
+        """
+        The metrics added to this registry.
+        """
+        return list(self._metrics)
+
+    @property
+    def label_codec(self) -> LabelCodec:
+        """
+        The codec packing label sets into metric keys, created on first access.
+        """
+        if self._label_codec is None:
+            self._label_codec = LabelCodec(
+                self,
+                compact=self.compact_labels,
+                key=self.label_dict_key,
+            )
+        return self._label_codec
+
+    @property
+    def batch_pipeline(self):
+        """
+        The pipeline of the batch open in the current context, if any.
+        """
+        batch = self._batch.get()
+        return batch and batch[0]
+
+    def add_flush_callback(self, callback: callable, start: int = 0):
+        """
+        Run a function once the batch open in the current context is written.
+
+        Lets metrics keep local state in step with Redis: the callback only
+        runs if the commands queued from `start` up to now all succeeded, and
+        is dropped if the batch is discarded.
+
+        :param callback: A function taking no arguments.
+        :param start: Position in the batch pipeline of the first command
+        the callback depends on.
+        """
+        pipeline, callbacks = self._batch.get()
+        callbacks.append((start, len(pipeline), callback))
+
+    @asynccontextmanager
+    async def batch(self):
+        """
+        Group metric updates into a single Redis pipeline.
+
+        Every update made by metrics of this registry inside the block is
+        queued and sent in one round trip when the block exits. Nothing is
+        written if the block raises. Nested batches join the outer one.
+
+        Updates made inside a batch return `None` instead of the Redis reply.
+        Errors while writing the batch are logged, not raised.
+        """
+        if self._batch.get() is not None:
+            yield
+            return
+
+        pipeline = self.db.pipeline()
+        callbacks = []
+        token = self._batch.set((pipeline, callbacks))
+        try:
+            yield
+        finally:
+            # On error the pipeline was never executed and holds no
+            # connection, it is simply dropped.
+            self._batch.reset(token)
+
+        # Like every other metric write, a failed flush is logged rather
+        # than raised into the application.
+        try:
+            results = await pipeline.execute(raise_on_error=False)
+        except Exception:
+            logger.exception('Error while sending a metric batch to Redis')
+            return
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            logger.error(
+                '%d of %d commands of a metric batch failed, first error: %r',
+                len(errors), len(results), errors[0],
+            )
+
+        for start, end, callback in callbacks:
+            if not any(isinstance(result, Exception) for result in results[start:end]):
+                callback()
+
+    async def output(self) -> str:
+        """
+        Render all metrics in the Prometheus text format.
+
+        The rendered lines of each metric are kept together with its version
+        counter, and reused as long as the counter has not changed, so only
+        metrics written since the last call are read and formatted again.
+        """
+        cached_metrics = [m for m in self._metrics if m.cache_output]
+        versions = {}
+        if cached_metrics:
+            pipeline = self.db.pipeline()
+            for metric in cached_metrics:
+                await pipeline.get(metric.metric_version_key)
+            versions = dict(zip(
+                [m.name for m in cached_metrics],
+                await pipeline.execute(),
+            ))
 
-    def output(self) -> str:
         payload = []
         for metric in self._metrics:
-            payload.append(metric.doc_string())
+            payload.append(metric.doc_string)
 
-            ms = metric.collect()
-            payload += sorted(ms)
+            version = versions.get(metric.name)
+            rendered = self._rendered.get(metric.name)
+            if version is not None and rendered is not None and rendered[0] == version:
+                ms = rendered[1]
+            else:
+                ms = sorted(await metric.collect())
+                if version is not None:
+                    self._rendered[metric.name] = (version, ms)
+
+            payload += ms
 
         return "\n".join(payload)
 
@@ -110,17 +371,101 @@ class RedisRegistry:
         """
         Registers a function to be periodically executed.
 
+        The refresher is started on the first registration made from
+        within a running event loop.
+
         :param func: An async function to call when refreshed.
         """
-        self._refresher.add_refresh_function(func)
+        refresher = self.refresher
+        refresher.add_refresh_function(func)
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        refresher.start()
 
     def stop(self):
-        self._refresher.stop()
+        if self._refresher is not None:
+            self._refresher.stop()
+            self._refresher = None
 
         for metric in self._metrics:
             metric.cleanup()
 
         self._metrics = []
+        self._rendered.clear()
+
+    def _limit_pool(self, pool):
+        """
+        Apply `child_max_connections` to the pool of a user-supplied client.
+
+        Only a blocking pool waits for a free connection at its limit. A
+        regular pool would raise, and the failed writes would be lost, so
+        it is left unlimited.
+        """
+        import redis.asyncio as redis
+
+        if isinstance(pool, redis.BlockingConnectionPool):
+            pool.max_connections = self.child_max_connections
+        else:
+            logger.warning(
+                'Not applying child_max_connections to %s, only a '
+                'BlockingConnectionPool waits for free connections',
+                type(pool).__name__,
+            )
+
+    def _reset_after_fork(self):
+        """
+        Drop the state inherited from the parent process.
+
+        Called in every forked child. Connections, the refresher, open
+        batches and per-process metric state of the parent must not be
+        shared with the child, so they are rebuilt lazily there.
+        """
+        self._forked = True
+
+        if self._owns_db:
+            self._db = None
+        elif self._db is not None:
+            pool = getattr(self._db, 'connection_pool', None)
+            if pool is None:
+                logger.warning(
+                    'Cannot reset the connections of %s after fork, '
+                    'create the client in the child process instead',
+                    type(self._db).__name__,
+                )
+            else:
+                pool.reset()
+                if self.child_max_connections:
+                    self._limit_pool(pool)
+
+        if self._refresher is not None:
+            functions = self._refresher._refresh_functions
+            self._refresher = AsyncRefresher(
+                use_apscheduler=self.use_apscheduler,
+            )
+            self._refresher._refresh_functions = list(functions)
+
+        self._batch = contextvars.ContextVar(
+            f'batch_{id(self)}', default=None,
+        )
+        self._rendered = {}
+
+        for metric in self._metrics:
+            metric.reset_after_fork()
+
+
+_registries: weakref.WeakSet[RedisRegistry] = weakref.WeakSet()
+
+
+def _reset_registries_after_fork():
+    for registry in list(_registries):
+        registry._reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_registries_after_fork)
 
 
 REGISTRY = RedisRegistry()
@@ -0,0 +1,158 @@
+"""
+Shared fixtures: an in-memory stand-in for the `redis.asyncio` client.
+"""
+
+import pytest
+
+
+class ResponseError(Exception):
+    pass
+
+
+def _to_bytes(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, float):
+        value = repr(value)
+    return str(value).encode()
+
+
+def _format_float(value: float) -> bytes:
+    # Redis stores INCRBYFLOAT results without a trailing '.0'
+    if value == int(value):
+        return str(int(value)).encode()
+    return repr(value).encode()
+
+
+class FakePipeline:
+    """
+    Non-transactional pipeline, queueing commands until `execute`
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.commands = []
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def __await__(self):
+        async def itself():
+            return self
+        return itself().__await__()
+
+    async def execute(self, raise_on_error=True):
+        commands, self.commands = self.commands, []
+        results = []
+        for name, args, kwargs in commands:
+            try:
+                results.append(await getattr(self.db, name)(*args, **kwargs))
+            except ResponseError as error:
+                results.append(error)
+
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+
+class FakeRedis:
+    """
+    The subset of Redis commands used by the library, with TTLs ignored
+    """
+
+    def __init__(self):
+        self.strings: dict[bytes, bytes] = {}
+        self.sets: dict[bytes, set] = {}
+        self.hashes: dict[bytes, dict] = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    async def get(self, key):
+        return self.strings.get(_to_bytes(key))
+
+    async def set(self, key, value, ex=None, px=None, nx=False):
+        key = _to_bytes(key)
+        if nx and key in self.strings:
+            return None
+        self.strings[key] = _to_bytes(value)
+        return True
+
+    async def delete(self, *keys):
+        return sum(self.strings.pop(_to_bytes(key), None) is not None for key in keys)
+
+    async def expire(self, key, seconds):
+        return _to_bytes(key) in self.strings
+
+    async def pttl(self, key):
+        return -1 if _to_bytes(key) in self.strings else -2
+
+    async def incrby(self, key, amount):
+        key = _to_bytes(key)
+        try:
+            value = int(self.strings.get(key, b'0')) + int(amount)
+        except ValueError:
+            raise ResponseError('value is not an integer or out of range')
+        self.strings[key] = str(value).encode()
+        return value
+
+    async def incr(self, key):
+        return await self.incrby(key, 1)
+
+    async def incrbyfloat(self, key, amount):
+        key = _to_bytes(key)
+        value = float(self.strings.get(key, b'0')) + float(amount)
+        self.strings[key] = _format_float(value)
+        return value
+
+    async def sadd(self, key, *members):
+        stored = self.sets.setdefault(_to_bytes(key), set())
+        before = len(stored)
+        stored.update(_to_bytes(member) for member in members)
+        return len(stored) - before
+
+    async def srem(self, key, *members):
+        stored = self.sets.get(_to_bytes(key), set())
+        for member in members:
+            stored.discard(_to_bytes(member))
+
+    async def smembers(self, key):
+        return set(self.sets.get(_to_bytes(key), set()))
+
+    async def hget(self, key, field):
+        return self.hashes.get(_to_bytes(key), {}).get(_to_bytes(field))
+
+    async def hmget(self, key, fields):
+        stored = self.hashes.get(_to_bytes(key), {})
+        return [stored.get(_to_bytes(field)) for field in fields]
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(_to_bytes(key), {}))
+
+    async def hset(self, key, field, value):
+        self.hashes.setdefault(_to_bytes(key), {})[_to_bytes(field)] = _to_bytes(value)
+        return 1
+
+    async def hsetnx(self, key, field, value):
+        stored = self.hashes.setdefault(_to_bytes(key), {})
+        if _to_bytes(field) in stored:
+            return 0
+        stored[_to_bytes(field)] = _to_bytes(value)
+        return 1
+
+    async def hdel(self, key, *fields):
+        stored = self.hashes.get(_to_bytes(key), {})
+        return sum(stored.pop(_to_bytes(field), None) is not None for field in fields)
+
+
+@pytest.fixture
+def db():
+    return FakeRedis()
@@ -0,0 +1,91 @@
+import asyncio
+
+from prometheus_redis.labels import LabelCodec
+from prometheus_redis.metrics import Gauge
+from prometheus_redis.registry import RedisRegistry
+
+
+def test_base64_round_trip(db):
+    codec = RedisRegistry(db=db).label_codec
+
+    async def scenario():
+        packed = await codec.encode({'b': '2', 'a': '1'})
+        return packed, await codec.decode(packed)
+
+    packed, labels = asyncio.run(scenario())
+
+    assert not packed.startswith('#')
+    assert labels == {'a': '1', 'b': '2'}
+    assert db.hashes == {}
+
+
+def test_compact_ids_shared_between_processes(db):
+    first = RedisRegistry(db=db, compact_labels=True).label_codec
+    second = RedisRegistry(db=db, compact_labels=True).label_codec
+
+    async def scenario():
+        packed = await first.encode_many([{'a': '1'}, {'a': '2'}, {'a': '1'}])
+        return packed, await second.encode({'a': '2'}), await second.decode(packed[0])
+
+    packed, other, labels = asyncio.run(scenario())
+
+    assert packed == ['#1', '#2', '#1']
+    assert other == '#2'
+    assert labels == {'a': '1'}
+
+
+def test_lost_interning_race(db):
+    codec = RedisRegistry(db=db, compact_labels=True).label_codec
+    rival = RedisRegistry(db=db, compact_labels=True).label_codec
+    lookup = db.hmget
+
+    async def racing_hmget(key, fields):
+        # Another process interns the same label set right after our lookup
+        db.hmget = lookup
+        result = await lookup(key, fields)
+        await rival.encode({'a': 'raced'})
+        return result
+
+    db.hmget = racing_hmget
+
+    async def scenario():
+        return await codec.encode_many([{'a': 'raced'}, {'a': 'free'}])
+
+    packed = asyncio.run(scenario())
+
+    assert packed == ['#1', '#3']
+    labels = db.hashes[codec.labels_key.encode()]
+    # The ID reserved for the lost label set is released
+    assert labels == {b'#1': b'{"a": "raced"}', b'#3': b'{"a": "free"}'}
+    assert db.hashes[codec.ids_key.encode()][b'{"a": "raced"}'] == b'#1'
+
+
+def test_unknown_id_is_reloaded(db):
+    writer = RedisRegistry(db=db, compact_labels=True).label_codec
+    reader = LabelCodec(RedisRegistry(db=db))
+
+    async def scenario():
+        await reader.decode(await writer.encode({'a': '1'}))
+        return await reader.decode(await writer.encode({'a': '2'}))
+
+    assert asyncio.run(scenario()) == {'a': '2'}
+
+
+def test_gauge_index_not_interned(db):
+    async def scenario():
+        for value in range(3):
+            registry = RedisRegistry(db=db, compact_labels=True)
+            gauge = Gauge('g', 'Gauge', labelnames=['a'], registry=registry,
+                          refresh_enable=False)
+            await gauge.set(value, labels={'a': 'x'})
+        return await gauge.collect()
+
+    collected = asyncio.run(scenario())
+
+    assert sorted(db.sets[b'g_group']) == [b'g:#1.1', b'g:#1.2', b'g:#1.3']
+    assert db.hashes[b'prometheus_redis_labels:labels'] == {b'#1': b'{"a": "x"}'}
+    assert sorted(collected) == [
+        'g{a="x",gauge_index="1"} 0.0',
+        'g{a="x",gauge_index="2"} 1.0',
+        'g{a="x",gauge_index="3"} 2.0',
+    ]
@@ -0,0 +1,100 @@
+import asyncio
+
+from prometheus_redis.metrics import CommonGauge, Counter, Summary
+from prometheus_redis.metrics.histogram import Histogram
+from prometheus_redis.migration import migrate_label_encoding
+from prometheus_redis.registry import RedisRegistry
+
+
+def make_metrics(registry):
+    return [
+        Counter('requests', 'Requests', labelnames=['path'], registry=registry),
+        CommonGauge('queue', 'Queue size', labelnames=['name'], registry=registry),
+        Summary('latency', 'Latency', labelnames=['path'], registry=registry),
+        Histogram('size', 'Size', labelnames=['path'], buckets=[1, 10], registry=registry),
+    ]
+
+
+async def collect(metrics):
+    return {metric.name: sorted(await metric.collect()) for metric in metrics}
+
+
+async def series_keys(db, metrics):
+    keys = set()
+    for metric in metrics:
+        keys |= await db.smembers(metric.metric_group_key)
+    return keys
+
+
+def test_migrate_to_compact_and_back(db):
+    registry = RedisRegistry(db=db)
+    counter, gauge, summary, histogram = metrics = make_metrics(registry)
+
+    async def scenario():
+        await counter.inc_many([({'path': '/a'}, 2), ({'path': '/b'}, 1)])
+        await gauge.set(3.5, labels={'name': 'jobs'})
+        await summary.observe_many([({'path': '/a'}, 0.5), ({'path': '/a'}, 1.25)])
+        await histogram.observe_many([({'path': '/a'}, 5), ({'path': '/a'}, 0.5)])
+        before = await collect(metrics)
+
+        to_compact = await migrate_label_encoding(registry, compact=True)
+        compact_keys = await series_keys(db, metrics)
+        compact = await collect(metrics)
+
+        back = await migrate_label_encoding(registry, compact=False)
+        base64_keys = await series_keys(db, metrics)
+        after = await collect(metrics)
+
+        rerun = await migrate_label_encoding(registry, compact=False)
+        return before, to_compact, compact_keys, compact, back, base64_keys, after, rerun
+
+    before, to_compact, compact_keys, compact, back, base64_keys, after, rerun = asyncio.run(scenario())
+
+    assert to_compact == back == len(compact_keys) == 9
+    assert all(key.split(b':', 1)[1].startswith(b'#') for key in compact_keys)
+    assert not any(key.split(b':', 1)[1].startswith(b'#') for key in base64_keys)
+    assert before == compact == after
+    assert before['requests'] == ['requests{path="/a"} 2', 'requests{path="/b"} 1']
+    assert rerun == 0
+    # Only the migrated series remain
+    assert set(db.strings) - {b'prometheus_redis_labels:next'} == base64_keys | {
+        f'{m.name}_version'.encode() for m in metrics
+    }
+
+
+def test_merge_into_existing_float_sum(db):
+    old_registry = RedisRegistry(db=db)
+    old_summary, = [m for m in make_metrics(old_registry) if m.name == 'latency']
+    new_registry = RedisRegistry(db=db, compact_labels=True)
+    new_summary, = [m for m in make_metrics(new_registry) if m.name == 'latency']
+
+    async def scenario():
+        # The old sum is integral, stored as "4" by INCRBYFLOAT
+        await old_summary.observe(1.5, labels={'path': '/a'})
+        await old_summary.observe(2.5, labels={'path': '/a'})
+        # Writers switched before the migration
+        await new_summary.observe(2.5, labels={'path': '/a'})
+
+        migrated = await migrate_label_encoding(new_registry, compact=True)
+        return migrated, await new_summary.collect()
+
+    migrated, collected = asyncio.run(scenario())
+
+    assert migrated == 2
+    assert sorted(collected) == ['latency_count{path="/a"} 3', 'latency_sum{path="/a"} 6.5']
+    assert all(key.split(b':', 1)[1].startswith(b'#') for key in db.sets[b'latency_group'])
+
+
+def test_merge_keeps_newer_gauge_value(db):
+    old_registry = RedisRegistry(db=db)
+    old_gauge = CommonGauge('queue', 'Queue size', registry=old_registry)
+    new_registry = RedisRegistry(db=db, compact_labels=True)
+    new_gauge = CommonGauge('queue', 'Queue size', registry=new_registry)
+
+    async def scenario():
+        await old_gauge.set(1)
+        await new_gauge.set(7)
+        await migrate_label_encoding(new_registry, compact=True)
+        return await new_gauge.collect()
+
+    assert asyncio.run(scenario()) == ['queue 7']